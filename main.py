@@ -6,6 +6,8 @@ import datetime
 
 app = Flask(__name__)
 app.secret_key = 'secure-secret-key'
+# Обмеження розміру запиту (завантажених файлів), 16 МБ
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
 # Сервіс аутентифікації
 auth_service = AuthService()
@@ -75,7 +77,19 @@ def compare():
         comparer = TextComparer(text1, text2)
         result = comparer.compare_all()
         result['generated'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    return render_template('index.html', result=result)
+    return render_template('index.html', result=result, form=request.form)
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    # Запит понад MAX_CONTENT_LENGTH: дані форми недоступні, показуємо сторінку запиту з помилкою
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    error = f'Запит завеликий: загальний розмір не може перевищувати {limit_mb} МБ.'
+    if request.endpoint in ('login', 'register'):
+        return render_template(f'{request.endpoint}.html', error=error), 413
+    if 'user' not in session:
+        return redirect(url_for('login'))
+    return render_template('index.html', result=None, form={}, error=error), 413
 
 
 if __name__ == '__main__':
@@ -2,38 +2,66 @@ import re
 import math
 import os
 import json
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
 from werkzeug.security import generate_password_hash, check_password_hash
 
+# Слова (послідовність букв/цифр)
+_WORD_RE = re.compile(r"\b\w+\b")
+# Межі речень
+_SENT_RE = re.compile(r'[.!?]')
+
+
+# Для ASCII-тексту: усі символи, що не є \w (буква, цифра, _), замінюємо пробілом
+_ASCII_NON_WORD = str.maketrans({chr(c): ' ' for c in range(128) if not (chr(c).isalnum() or chr(c) == '_')})
+
+
+def _tokenize(text: str) -> list[str]:
+    """
+    Повертає список слів тексту у нижньому регістрі.
+    Для ASCII-тексту використовує str.translate + split (швидше за regex),
+    для решти - _WORD_RE; результат однаковий.
+    """
+    text = text.lower()
+    if text.isascii():
+        return text.translate(_ASCII_NON_WORD).split()
+    return _WORD_RE.findall(text)
+
 
 class StylisticFingerprint:
     """
     Клас для створення та порівняння стилістичних "відбитків" тексту.
     """
-    def __init__(self, text: str):
+    def __init__(self, text: str, tokens: list[str] | None = None):
         self.text = text
-        self.fingerprint = self._compute_fingerprint()
+        self.fingerprint = self._compute_fingerprint(tokens)
 
-    def _compute_fingerprint(self) -> list[float]:
-        # Розділяємо текст на речення, використовуючи розділові знаки ., !, ?
-        # Видаляємо порожні рядки після розбиття
-        sentences = [s.strip() for s in re.split(r'[.!?]', self.text) if s.strip()]
+    def _compute_fingerprint(self, tokens: list[str] | None = None) -> list[float]:
+        # Розділяємо текст на речення, використовуючи розділові знаки ., !, ?,
+        # і одразу рахуємо кількість слів у кожному; порожні фрагменти (0 слів) відкидаємо
+        segments = _SENT_RE.split(self.text)
+        sentence_lens = [n for n in map(len, map(str.split, segments)) if n]
 
-        # Витягаємо всі слова (послідовність букв/цифр) у нижньому регістрі
-        words = re.findall(r"\b\w+\b", self.text.lower())
+        # Слова (послідовність букв/цифр) у нижньому регістрі; якщо токени не передані - токенізуємо
+        words = tokens if tokens is not None else _tokenize(self.text)
 
-        # Підраховуємо всі знаки пунктуації (кома, крапка, знак оклику тощо)
-        punctuation = re.findall(r'[,.!?;:]', self.text)
+        # Підраховуємо всі знаки пунктуації: кожен із ., !, ? розділяє два фрагменти,
+        # а коми, крапки з комою та двокрапки рахуємо str.count без списку збігів
+        punctuation = len(segments) - 1 + sum(map(self.text.count, ',;:'))
 
         # Обчислюємо середню довжину речення у словах - Якщо речень немає, повертаємо 0.0
-        avg_sentence = sum(len(s.split()) for s in sentences) / len(sentences) if sentences else 0.0
+        avg_sentence = sum(sentence_lens) / len(sentence_lens) if sentence_lens else 0.0
         # Обчислюємо середню довжину слова у символах - Якщо слів немає, повертаємо 0.0
-        avg_word = sum(len(w) for w in words) / len(words) if words else 0.0
+        avg_word = sum(map(len, words)) / len(words) if words else 0.0
         # Обчислюємо щільність пунктуації як кількість знаків пунктуації на слово
-        punc_density = len(punctuation) / len(words) if words else 0.0
+        punc_density = punctuation / len(words) if words else 0.0
         # Лексичне різноманіття = кількість унікальних слів / загальна кількість слів
         lex_div = len(set(words)) / len(words) if words else 0.0
         # Частка коротких речень (менше 5 слів)
-        short_ratio = len([s for s in sentences if len(s.split()) < 5]) / len(sentences) if sentences else 0.0
+        short_ratio = sum(n < 5 for n in sentence_lens) / len(sentence_lens) if sentence_lens else 0.0
 
         return [round(x, 3) for x in (avg_sentence, avg_word, punc_density, lex_div, short_ratio)]
 
@@ -61,138 +89,248 @@ class JaccardSimilarity:
     Клас для обчислення Jaccard-схожості між двома текстами.
     """
     @staticmethod
-    def compute(text1: str, text2: str) -> float:
-        # Створюємо множину унікальних слів з першого тексту
-        set1 = set(re.findall(r"\b\w+\b", text1.lower()))
+    def compute(text1: str, text2: str,
+                tokens1: list[str] | None = None, tokens2: list[str] | None = None) -> float:
+        # Створюємо множину унікальних слів з першого тексту (якщо токени не передані - токенізуємо)
+        set1 = set(tokens1 if tokens1 is not None else _tokenize(text1))
         # Створюємо множину унікальних слів з другого тексту
-        set2 = set(re.findall(r"\b\w+\b", text2.lower()))
+        set2 = set(tokens2 if tokens2 is not None else _tokenize(text2))
+        return JaccardSimilarity.compute_sets(set1, set2)
 
-        # Обчислюємо об’єднання та перетин множин
-        union = set1 | set2
-        inter = set1 & set2
+    @staticmethod
+    def compute_sets(set1: set[str], set2: set[str]) -> float:
+        """Jaccard-схожість для вже побудованих множин унікальних слів."""
+        # Обчислюємо потужність перетину; потужність об’єднання |A|+|B|-|A∩B| -
+        # арифметично, не створюючи множину об’єднання
+        inter = len(set1 & set2)
+        union = len(set1) + len(set2) - inter
 
         # Якщо об’єднання порожнє (обидва тексти не містять слів), повертаємо 0.0
         # Інакше повертаємо відношення потужності перетину до потужності об’єднання
-        return round(len(inter) / len(union), 4) if union else 0.0
+        return round(inter / union, 4) if union else 0.0
 
 
 class TfIdfSimilarity:
     """
     Клас для обчислення TF-IDF векторів і косинусної схожості.
+    Формули відповідають TfidfVectorizer(token_pattern=r"\\b\\w+\\b", sublinear_tf=True,
+    smooth_idf=True, norm='l2') зі scikit-learn (типовий token_pattern відкидає однолітерні
+    слова): tf = 1 + log(count), idf = log((N+1)/(df+1)) + 1, L2-нормалізація;
+    вектори розріджені (зберігаються лише ненульові ваги).
     """
-    def __init__(self, texts: list[str]):
+    def __init__(self, texts: list[str], tokenized: list[list[str]] | None = None):
         # Зберігаємо список текстів (зазвичай два текстові документи)
         self.texts = texts
+        # Токенізуємо кожен текст один раз (або використовуємо вже готові токени)
+        self._tokenized = tokenized if tokenized is not None else [_tokenize(t) for t in texts]
         # Побудова спільного словника (vocab) із унікальних слів усіх текстів
         self.vocab = self._build_vocab()
         # Обчислення зворотної частоти документів (IDF) для кожного слова словника
         self.idf = self._compute_idf()
 
     def _build_vocab(self) -> list[str]:
-        # Токенізуємо кожен текст (виділяємо слова у нижньому регістрі)
-        tokenized = [re.findall(r"\b\w+\b", t.lower()) for t in self.texts]
-        # Створюємо множину усіх унікальних слів і повертаємо відсортований список
-        return sorted({w for toks in tokenized for w in toks})
+        # Створюємо множину усіх унікальних слів; порядок не важливий, тож не сортуємо
+        return list({w for toks in self._tokenized for w in toks})
 
     def _compute_idf(self) -> dict[str, float]:
         N = len(self.texts)
-        # Знову токенізуємо всі тексти
-        tokenized = [re.findall(r"\b\w+\b", t.lower()) for t in self.texts]
-        # Для кожного слова словника рахуємо, у скількох документах воно зустрічається (df)
-        df = {w: sum(1 for toks in tokenized if w in toks) for w in self.vocab}
-        # Обчислюємо згладжену IDF: log((N+1)/(df[w]+1)) + 1
-        return {w: math.log((N + 1) / (df[w] + 1)) + 1 for w in self.vocab}
-
-    def compute_vectors(self) -> list[list[float]]:
+        # Для кожного слова рахуємо, у скількох документах воно зустрічається (df),
+        # одним проходом по множинах унікальних слів кожного документа
+        df = Counter()
+        for toks in self._tokenized:
+            df.update(set(toks))
+        # Згладжена IDF: log((N+1)/(df[w]+1)) + 1 залежить лише від df ∈ [1, N],
+        # тому обчислюємо N+1 значень один раз і беремо IDF слова з таблиці
+        idf_by_df = [math.log((N + 1) / (d + 1)) + 1 for d in range(N + 1)]
+        return {w: idf_by_df[df[w]] for w in self.vocab}
+
+    def compute_vectors(self) -> list[dict[str, float]]:
         """
-        Повертає список TF-IDF векторів для кожного тексту.
+        Повертає список розріджених TF-IDF векторів {слово: вага} для кожного тексту.
         Кроки:
-        1) Токенізуємо текст.
-        2) Для кожного слова словника рахуємо tf = 1 + log(count), якщо count>0, інакше 0.
-        3) Множимо tf на відповідну idf[w] для формування елементу вектора.
+        1) Беремо токени тексту, отримані в __init__.
+        2) Рахуємо частоти слів одним проходом (Counter).
+        3) Для кожного присутнього слова tf = 1 + log(count), множимо на idf[w];
+           відсутні слова (нульові елементи) у векторі не зберігаються.
         4) Застосовуємо L2-нормалізацію: ділити кожен елемент вектора на його довжину.
         """
         vectors = []
-        for text in self.texts:
-            tokens = re.findall(r"\b\w+\b", text.lower())
-            vec = []
-            for w in self.vocab:
-                count = tokens.count(w)
-                tf = 1 + math.log(count) if count > 0 else 0.0
-                vec.append(tf * self.idf[w])
-            norm = math.sqrt(sum(x * x for x in vec))
-            vectors.append([x / norm for x in vec] if norm else vec)
+        for tokens in self._tokenized:
+            counts = Counter(tokens)
+            vec = {w: (1 + math.log(count)) * self.idf[w] for w, count in counts.items()}
+            # L2-норма через math.hypot рахується в C без проміжного генератора квадратів
+            norm = math.hypot(*vec.values())
+            if norm:
+                inv = 1 / norm
+                vec = {w: x * inv for w, x in vec.items()}
+            vectors.append(vec)
         return vectors
 
     @staticmethod
-    def compare(vec1: list[float], vec2: list[float]) -> float:
-        dot = sum(a * b for a, b in zip(vec1, vec2))
-        return round(dot, 4) if vec1 and vec2 else 0.0
+    def compare(vec1: dict[str, float], vec2: dict[str, float]) -> float:
+        """
+        Косинусна схожість двох векторів з compute_vectors.
+        Вектори вже L2-нормалізовані, тому достатньо скалярного добутку
+        (для порожнього вектора він дорівнює 0.0). Результат не округлюється.
+        """
+        # Скалярний добуток рахуємо лише по спільних словах, перебираючи менший вектор
+        if len(vec1) > len(vec2):
+            vec1, vec2 = vec2, vec1
+        return sum((x * vec2[w] for w, x in vec1.items() if w in vec2), 0.0)
 
 
 class TextComparer:
     """
     Головний клас для порівняння двох текстів за всіма метриками.
+    Результати кешуються (LRU) за гешами пари текстів, оскільки обчислення детерміноване.
     """
+    _cache_size = 512
+    _cache: OrderedDict[tuple[bytes, bytes], dict[str, float]] = OrderedDict()
+    _cache_lock = threading.Lock()
+
     def __init__(self, text1: str, text2: str):
         self.text1 = text1
         self.text2 = text2
 
+    @staticmethod
+    def _digest(text: str) -> bytes:
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
     def compare_all(self) -> dict[str, float]:
-        sf1 = StylisticFingerprint(self.text1).fingerprint
-        sf2 = StylisticFingerprint(self.text2).fingerprint
+        key = (self._digest(self.text1), self._digest(self.text2))
+        cache = TextComparer._cache
+        with TextComparer._cache_lock:
+            cached = cache.get(key)
+            if cached is not None:
+                cache.move_to_end(key)
+        if cached is None:
+            cached = self._compute_all()
+            with TextComparer._cache_lock:
+                cache[key] = cached
+                cache.move_to_end(key)
+                if len(cache) > TextComparer._cache_size:
+                    cache.popitem(last=False)
+        # Повертаємо копію, щоб зміни результату викликачем не псували кеш
+        return dict(cached)
+
+    def _compute_all(self) -> dict[str, float]:
+        """
+        Обчислює всі метрики без кешу.
+        Метрики обчислюються послідовно: це чистий Python (regex, dict), який тримає GIL,
+        тож потоки не дали б виграшу, а процеси коштували б дорожче за саме обчислення.
+        """
+        # Тривіальні випадки: порожній текст нічим не схожий, однакові тексти (зі словами) - повністю
+        if not self.text1 or not self.text2:
+            return {'stylistic': 0.0, 'jaccard': 0.0, 'tfidf': 0.0}
+        if self.text1 == self.text2 and _WORD_RE.search(self.text1):
+            return {'stylistic': 1.0, 'jaccard': 1.0, 'tfidf': 1.0}
+        # Токенізуємо кожен текст один раз і передаємо токени всім метрикам
+        t1, t2 = _tokenize(self.text1), _tokenize(self.text2)
+        sf1 = StylisticFingerprint(self.text1, t1).fingerprint
+        sf2 = StylisticFingerprint(self.text2, t2).fingerprint
         style_score = StylisticFingerprint.compare(sf1, sf2)
-        jaccard_score = JaccardSimilarity.compute(self.text1, self.text2)
-        tfidf = TfIdfSimilarity([self.text1, self.text2])
-        v1, v2 = tfidf.compute_vectors()
-        tfidf_score = TfIdfSimilarity.compare(v1, v2)
+        # Множини унікальних слів будуємо один раз: для Jaccard і перевірки спільних слів
+        s1, s2 = set(t1), set(t2)
+        jaccard_score = JaccardSimilarity.compute_sets(s1, s2)
+        # Без спільних слів косинусна схожість дорівнює 0, TF-IDF можна не будувати
+        if s1.isdisjoint(s2):
+            tfidf_score = 0.0
+        else:
+            tfidf = TfIdfSimilarity([self.text1, self.text2], [t1, t2])
+            v1, v2 = tfidf.compute_vectors()
+            tfidf_score = TfIdfSimilarity.compare(v1, v2)
         return {
             'stylistic': style_score,
             'jaccard': jaccard_score,
-            'tfidf': tfidf_score
+            'tfidf': round(tfidf_score, 4)
         }
 
 
-class User:
-    """Простий POJO-клас користувача з гешованим паролем."""
-    def __init__(self, username: str, password_hash: str):
-        self.username = username
-        self.password_hash = password_hash
-
-
 class AuthService:
-    """Сервіс для реєстрації та аутентифікації користувачів з flat-file JSON."""
-    def __init__(self, file_path: str = 'users.json'):
-        self.file_path = file_path
-        self._users: dict[str, User] = {}
-        self._load_users()
-
-    def _load_users(self) -> None:
-        if os.path.exists(self.file_path):
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            for username, pw_hash in data.items():
-                self._users[username] = User(username, pw_hash)
-        else:
-            # створити порожній файл
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump({}, f)
+    """
+    Сервіс для реєстрації та аутентифікації користувачів у SQLite.
+    hash_method передається у generate_password_hash (наприклад 'scrypt:32768:8:1'
+    або 'pbkdf2:sha256:600000') і задає алгоритм та вартість гешування нових паролів.
+    Геш зберігає назву методу, тому check_password_hash перевіряє й старі записи.
+    Користувачі зі старого flat-file JSON (legacy_json_path) імпортуються при старті.
+    Успішні перевірки пароля кешуються на verify_ttl секунд, щоб повторні входи
+    не запускали дороге гешування.
+    Для неіснуючого користувача пароль перевіряється з гешем-заглушкою методу hash_method;
+    однаковий час відповіді гарантується лише для користувачів, чиї геші мають той самий метод.
+    """
+    _verified_cache_size = 1024
+
+    def __init__(self, db_path: str = 'users.db', hash_method: str = 'scrypt:32768:8:1',
+                 legacy_json_path: str = 'users.json', verify_ttl: float = 300.0):
+        self.db_path = db_path
+        self.hash_method = hash_method
+        self.verify_ttl = verify_ttl
+        # Геш-заглушка: для неіснуючого користувача теж виконуємо перевірку (однаковий час відповіді).
+        # Обмеження: заглушка використовує hash_method; якщо збережені геші (наприклад, імпортовані
+        # з users.json) мають інший метод чи вартість, час відповіді для неіснуючого користувача
+        # відрізнятиметься від часу для неправильного пароля такого користувача
+        self._dummy_hash = generate_password_hash('dummy-password', method=self.hash_method)
+        # Кеш успішних перевірок: (геш, ключований дайджест пароля) -> час завершення дії.
+        # Пароль у відкритому вигляді не зберігається; ключ дайджесту живе лише в цьому процесі
+        self._verified: OrderedDict[tuple[str, bytes], float] = OrderedDict()
+        self._verified_key = os.urandom(32)
+        self._verified_lock = threading.Lock()
+        # Одне з'єднання на процес; доступ з різних потоків Flask серіалізуємо замком
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, pw_hash TEXT NOT NULL)'
+            )
+        self._import_json_users(legacy_json_path)
 
-    def _save_users(self) -> None:
-        data = {u: self._users[u].password_hash for u in self._users}
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    def _import_json_users(self, file_path: str) -> None:
+        if not os.path.exists(file_path):
+            return
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Наявних користувачів не перезаписуємо, тому імпорт можна повторювати
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO users (username, pw_hash) VALUES (?, ?)', data.items()
+            )
 
     def register(self, username: str, password: str) -> bool:
-        if username in self._users:
-            return False
-        pw_hash = generate_password_hash(password)
-        self._users[username] = User(username, pw_hash)
-        self._save_users()
-        return True
+        pw_hash = generate_password_hash(password, method=self.hash_method)
+        # Перевірка та вставка виконуються однією атомарною операцією
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                'INSERT OR IGNORE INTO users (username, pw_hash) VALUES (?, ?)', (username, pw_hash)
+            )
+        return cur.rowcount == 1
 
     def authenticate(self, username: str, password: str) -> bool:
-        user = self._users.get(username)
-        if not user:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT pw_hash FROM users WHERE username = ?', (username,)
+            ).fetchone()
+        if not row:
+            check_password_hash(self._dummy_hash, password)
             return False
-        return check_password_hash(user.password_hash, password)
+        return self._verify(row[0], password)
+
+    def _verify(self, pw_hash: str, password: str) -> bool:
+        digest = hashlib.blake2b(password.encode('utf-8'), digest_size=32, key=self._verified_key).digest()
+        key = (pw_hash, digest)
+        now = time.monotonic()
+        with self._verified_lock:
+            expires = self._verified.get(key)
+            if expires is not None:
+                if expires > now:
+                    self._verified.move_to_end(key)
+                    return True
+                del self._verified[key]
+        # Невдалі спроби не кешуються - кожна з них проходить повне гешування
+        if not check_password_hash(pw_hash, password):
+            return False
+        with self._verified_lock:
+            self._verified[key] = now + self.verify_ttl
+            self._verified.move_to_end(key)
+            if len(self._verified) > self._verified_cache_size:
+                self._verified.popitem(last=False)
+        return True